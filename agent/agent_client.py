@@ -14,12 +14,34 @@ from azure.identity import DefaultAzureCredential
 from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import PromptAgentDefinition
 
+# libyaml C bindings parse ~10x faster than the pure-Python loader; PyYAML
+# wheels bundle them on the common platforms, so fall back only when absent.
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
 CONFIG_PATH = Path(__file__).parent / "config" / "agent.yaml"
 
+# Parsed agent.yaml per path, stamped with (mtime_ns, size) so repeated loads in
+# one process (retries, tests) skip re-parsing unless the file has changed. A
+# changed file replaces its previous entry. The cached dict is shared between
+# callers, so treat it as read-only.
+_YAML_CACHE: dict[str, tuple[tuple[int, int], dict]] = {}
+
 
 def load_config() -> dict:
+    """Parsed agent.yaml with system_message already stripped of surrounding whitespace."""
+    st = os.stat(CONFIG_PATH)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _YAML_CACHE.get(str(CONFIG_PATH))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
     with open(CONFIG_PATH) as f:
-        return yaml.safe_load(f)
+        config = yaml.load(f, Loader=_Loader)
+    config["system_message"] = config["system_message"].strip()
+    _YAML_CACHE[str(CONFIG_PATH)] = (stamp, config)
+    return config
 
 
 def get_project_client() -> AIProjectClient:
@@ -35,7 +57,7 @@ def create_agent_version(client: AIProjectClient, config: dict):
         agent_name=config["name"],
         definition=PromptAgentDefinition(
             model=config["model"],
-            instructions=config["system_message"].strip(),
+            instructions=config["system_message"],
         ),
     )
     print(f"Created agent '{agent.name}' version {agent.version} (id: {agent.id})")